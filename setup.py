@@ -30,8 +30,10 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     install_requires=requirements(),
+    extras_require={"xxh3": ["xxhash"]},
     keywords=[],
     packages=find_packages(),
+    python_requires=">=3.8",
     entry_points={
         "console_scripts": ["text-dedup=text_dedup.cli:main"],
     },
@@ -10,7 +10,10 @@ def main():
     parser.add_argument("-i", "--inputs", type=str, required=True, nargs="+", help="input text files")
     parser.add_argument("-s", "--shard_root", type=str, required=True, help="shard directory")
     parser.add_argument("-o", "--output", type=str, required=True, help="deduplicated text path")
-    parser.add_argument("-f", "--hash_func_type", type=str, default="sha1", help="hash function name")
+    parser.add_argument(
+        "-f", "--hash_func_type", type=str, default="sha1", choices=["sha1", "xxh3", "blake2b"],
+        help="hash function name; `xxh3` requires `xxhash`. (default %(default)s)"
+    )
     parser.add_argument(
         "-r", "--hash_func_input_format", type=str, default="0-9가-힣ㄱ-ㅎㅏ-ㅣa-zA-Z",
         help="hash function input format regular expression. (default %(default)s)"
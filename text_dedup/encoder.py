@@ -1,29 +1,98 @@
 import math
+import mmap
 import os
 import re
-from collections import defaultdict
+import shutil
+import struct
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 from glob import glob
-from hashlib import sha1
-from multiprocessing import Pool, cpu_count
+from hashlib import blake2b, sha1
+from itertools import chain
+from multiprocessing import Pool, cpu_count, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from operator import itemgetter, methodcaller
 from tqdm import tqdm
-from typing import List, Union
+from typing import Iterable, List, Tuple, Union
+
+try:
+    from xxhash import xxh3_64
+except ImportError:
+    xxh3_64 = None
+
+_digest = methodcaller("digest")
+
+# shard record: digest size, text size, digest bytes, UTF-8 text bytes
+_RECORD_HEADER = struct.Struct("<BI")
+
+# UTF-8 encodings of exactly the characters `str.isspace` (and so `str.strip`) treats as whitespace
+_WHITESPACE = rb"[\t-\r\x1c- ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80"
+_NON_WHITESPACE_CHAR = rb"(?:(?!" + _WHITESPACE + rb")(?:[\x00-\x7f]|[\xc0-\xff][\x80-\xbf]*))"
+# a line stripped of surrounding whitespace like `str.strip`; it never crosses a line break
+_LINE_PATTERN = re.compile(_NON_WHITESPACE_CHAR + rb"(?:[^\r\n]*" + _NON_WHITESPACE_CHAR + rb")?")
 
 
 class Normalizer:
+    """
+    Example:
+        >>> normalizer = Normalizer("0-9가-힣ㄱ-ㅎㅏ-ㅣa-zA-Z")
+        >>> normalizer("Say 안녕, hello.")
+        $ 'Say안녕hello'
+        >>> normalizer.normalize_bytes(b"Say hello.")
+        $ b'Sayhello'
+        >>> normalizer.normalize_lines(b"Say hello.\\nSay, hello")
+        $ [b'Sayhello', b'Sayhello']
+    """
     def __init__(self, pattern: str = "0-9가-힣ㄱ-ㅎㅏ-ㅣa-zA-Z"):
-        self.pattern = re.compile(f"[^{pattern}]")
+        self.pattern = re.compile(f"[^{pattern}]+")
+        # ASCII bytes never appear inside multi-byte UTF-8 sequences,
+        # so rejected ASCII characters can be deleted from the raw bytes directly.
+        self.ascii_deletes = bytes(b for b in range(128) if self.pattern.match(chr(b)))
+        # same as above but keeping the newline, to normalize many lines at once.
+        # the newline goes first so that a trailing "-" in `pattern` stays a literal
+        self.lines_pattern = re.compile(f"[^\\n{pattern}]+")
+        self.lines_ascii_deletes = self.ascii_deletes.replace(b"\n", b"")
 
     def __call__(self, line: str) -> str:
         return self.pattern.sub("", line)
 
+    def normalize_bytes(self, line: bytes) -> bytes:
+        line = line.translate(None, self.ascii_deletes)
+        if line.isascii():
+            return line
+        return self.pattern.sub("", line.decode("utf-8")).encode("utf-8")
+
+    def normalize_lines(self, lines: bytes) -> List[bytes]:
+        """
+        Normalize newline-joined UTF-8 lines with a single pass over the whole
+        buffer instead of one translate/regex call and allocation per line.
+        """
+        lines = lines.translate(None, self.lines_ascii_deletes)
+        if not lines.isascii():
+            lines = self.lines_pattern.sub("", lines.decode("utf-8")).encode("utf-8")
+        return lines.split(b"\n")
+
 
 class Encoder:
     """
+    `hash_func_type` is a callable or one of
+        - "sha1": 160-bit SHA1
+        - "xxh3": 64-bit XXH3, requires `xxhash`
+        - "blake2b": 64-bit BLAKE2b
+
+    Deduplication only needs equality of keys, so a 64-bit hash is enough
+    and makes every shard record 12 bytes shorter than SHA1.
+    Hash codes are raw digest bytes.
+
     Example:
         >>> normalizer = Normalizer("0-9가-힣ㄱ-ㅎㅏ-ㅣa-zA-Z")
         >>> encoder = Encoder("sha1", normalizer)
-        >>> encoder("예문입니다")
-        $ ('예문입니다', '93620c8a877cbc8701923138c217c9a8327815e1')
+        >>> line, code = encoder("예문입니다")
+        >>> code.hex()
+        $ '93620c8a877cbc8701923138c217c9a8327815e1'
     """
     def __init__(self, hash_func_type, normalizer):
         self.normalizer = normalizer
@@ -31,21 +100,212 @@ class Encoder:
             self.hash = hash_func_type
         elif hash_func_type == "sha1":
             self.hash = sha1
+        elif hash_func_type == "xxh3":
+            if xxh3_64 is None:
+                raise ImportError("`xxh3` requires the `xxhash` package. `pip install xxhash`")
+            self.hash = xxh3_64
+        elif hash_func_type == "blake2b":
+            self.hash = partial(blake2b, digest_size=8)
         else:
-            raise ValueError("Support only `callable` or `sha1`")
+            raise ValueError("Support only `callable`, `sha1`, `xxh3` or `blake2b`")
 
     def __call__(self, line: str):
         return self.encode(line)
 
     def encode(self, line: str):
-        norm = self.normalizer(line)
-        code = self.hash(norm.encode("utf-8")).hexdigest()
+        norm = self.normalizer.normalize_bytes(line.encode("utf-8"))
+        code = self.hash(norm).digest()
         return line, code
 
-    def encode_batch(self, lines: List[str], n_processes: int, chunksize: int = None):
-        with Pool(processes=n_processes) as p:
-            out = list(p.imap(self.encode, lines, chunksize=chunksize))
-        return out
+    def hash_shared(self, shm_name: str, start: int, lengths_start: int, end: int) -> List[bytes]:
+        """
+        Hash the UTF-8 lines stored at `[start, end)` of the shared memory block
+        `shm_name`: the lines joined by newlines, followed at `lengths_start` by
+        their byte lengths as int64.
+        """
+        shm = SharedMemory(name=shm_name)
+        try:
+            data = bytes(shm.buf[start:lengths_start])
+            lengths = array("q", bytes(shm.buf[lengths_start:end]))
+        finally:
+            shm.close()
+        if data.count(b"\n") == len(lengths) - 1:
+            # no line contains a newline itself, so the chunk is normalized in one pass
+            norms = self.normalizer.normalize_lines(data)
+        else:
+            norms = map(self.normalizer.normalize_bytes, split_by_lengths(data, lengths))
+        return self._hash_many(norms)
+
+    def _hash_many(self, norms: Iterable[bytes]) -> List[bytes]:
+        """
+        Hash a whole chunk of normalized inputs at once.
+        Every message is independent, so this is the single place to plug in
+        a multi-buffer hash implementation.
+        The `map` chain runs the loop in C, without a bytecode dispatch per line.
+        """
+        return list(map(_digest, map(self.hash, norms)))
+
+    def pool(self, n_processes: int) -> Pool:
+        """
+        Returns a worker pool holding a copy of this encoder. It is sent to each
+        worker once at start-up, so a pool can be reused for every batch.
+        """
+        # workers must share the parent's resource tracker; otherwise each one starts
+        # its own, which reports every shared memory block it attached to as leaked
+        resource_tracker.ensure_running()
+        return Pool(processes=n_processes, initializer=_init_worker, initargs=(self,))
+
+    def encode_batch(
+        self,
+        lines: Union[List[str], List[bytes]],
+        n_processes: int,
+        chunksize: int = None,
+        pool: Pool = None
+    ):
+        """
+        Split `lines` into chunks of `chunksize` lines (one per process if `chunksize`
+        is None) and dispatch each chunk as a single task. The lines are passed to
+        the workers through one shared memory block, so each task only carries
+        its byte range and only the hash codes are sent back.
+        `pool` is a pool from `Encoder.pool`; a temporary one is created if None.
+        `lines` are either all `str` or all UTF-8 `bytes`, and are returned as given
+        with their hash codes.
+        """
+        if pool is None:
+            with self.pool(n_processes) as pool:
+                return self.encode_batch(lines, n_processes, chunksize, pool)
+        if chunksize is None:
+            chunksize = math.ceil(len(lines) / n_processes)
+        chunksize = max(1, chunksize)
+        if lines and isinstance(lines[0], str):
+            byte_lines = [line.encode("utf-8") for line in lines]
+        else:
+            byte_lines = lines
+        # each chunk is stored as its newline-joined lines followed by their byte lengths;
+        # the lengths keep line boundaries exact even when a line contains a newline
+        chunks = []
+        for b in range(0, len(byte_lines), chunksize):
+            chunk_lines = byte_lines[b: b + chunksize]
+            chunks.append((b"\n".join(chunk_lines), array("q", map(len, chunk_lines)).tobytes()))
+        shm = SharedMemory(create=True, size=max(1, sum(len(data) + len(lengths) for data, lengths in chunks)))
+        try:
+            ranges, offset = [], 0
+            for data, lengths in chunks:
+                lengths_start = offset + len(data)
+                end = lengths_start + len(lengths)
+                shm.buf[offset: lengths_start] = data
+                shm.buf[lengths_start: end] = lengths
+                ranges.append((shm.name, offset, lengths_start, end))
+                offset = end
+            codes = list(chain.from_iterable(pool.starmap(_hash_shared, ranges)))
+        finally:
+            shm.close()
+            shm.unlink()
+        if len(codes) != len(lines):
+            raise ValueError(f"got {len(codes)} hash codes for {len(lines)} lines")
+        return list(zip(lines, codes))
+
+
+_ENCODER = None
+
+
+def _init_worker(encoder: Encoder):
+    global _ENCODER
+    _ENCODER = encoder
+
+
+def _hash_shared(shm_name: str, start: int, lengths_start: int, end: int) -> List[bytes]:
+    return _ENCODER.hash_shared(shm_name, start, lengths_start, end)
+
+
+class ShardWriter:
+    """
+    Appends encoded lines to shard files as binary records (see `pack_record`).
+    Up to `max_open_files` buffered handles are kept open across batches;
+    the least recently used one is closed when the limit is reached.
+    Shard paths are memoized by leading digest bytes as they are first used.
+    With `precompute=True` and `prefix_length <= 4`, all of them (and their
+    directories) are created up front instead, which pays off for long tasks.
+
+    Example:
+        >>> with ShardWriter("path/to/shard", prefix_length=4) as writer:
+        >>>     writer.write_many(encoder.encode_batch(["예문입니다".encode("utf-8")], n_processes=1))
+        $ appends the record to path/to/shard/93/62.shard
+    """
+    def __init__(
+        self,
+        shard_root: str,
+        prefix_length: int = 4,
+        max_open_files: int = 512,
+        buffer_size: int = 1 << 16,
+        precompute: bool = False
+    ):
+        assert prefix_length >= 2 and max_open_files > 0
+        self.shard_root = shard_root
+        self.prefix_length = prefix_length
+        self.max_open_files = max_open_files
+        self.buffer_size = buffer_size
+        self.files = OrderedDict()
+        self.dirnames = set()
+        self.n_bytes = math.ceil(prefix_length / 2)
+        self.shard_paths = {}
+        if precompute and prefix_length <= 4:
+            for i in range(256 ** self.n_bytes):
+                self.shard_path(i.to_bytes(self.n_bytes, "big"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def shard_path(self, key: bytes) -> str:
+        """
+        Returns the shard path of the leading `ceil(prefix_length / 2)` digest bytes,
+        creating its directory the first time.
+        """
+        shard_path = self.shard_paths.get(key)
+        if shard_path is None:
+            shard_path = get_shard_path(self.shard_root, key.hex()[:self.prefix_length])
+            dirname = os.path.dirname(os.path.abspath(shard_path))
+            if dirname not in self.dirnames:
+                os.makedirs(dirname, exist_ok=True)
+                self.dirnames.add(dirname)
+            self.shard_paths[key] = shard_path
+        return shard_path
+
+    def write(self, shard_path: str, payload: bytes):
+        f = self.files.get(shard_path)
+        if f is None:
+            f = self._open(shard_path)
+        else:
+            self.files.move_to_end(shard_path)
+        f.write(payload)
+
+    def write_many(self, encoded_lines: List[Tuple[Union[str, bytes], bytes]]):
+        # group by the digest bytes covering the prefix; with an odd `prefix_length`
+        # two groups may share a shard, which is fine for appending.
+        n_bytes = self.n_bytes
+        shards = defaultdict(lambda: [])
+        for line, code in encoded_lines:
+            if isinstance(line, str):
+                line = line.encode("utf-8")
+            shards[code[:n_bytes]].append(pack_record(code, line))
+        for key, records in shards.items():
+            self.write(self.shard_path(key), b"".join(records))
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+    def _open(self, shard_path: str):
+        if len(self.files) >= self.max_open_files:
+            _, lru = self.files.popitem(last=False)
+            lru.close()
+        f = open(shard_path, "ab", buffering=self.buffer_size)
+        self.files[shard_path] = f
+        return f
 
 
 def encode_a_file(
@@ -54,25 +314,35 @@ def encode_a_file(
     chunksize: int,
     n_processes: int,
     hash_func: Encoder,
-    prefix_length: int = 4
+    prefix_length: int = 4,
+    writer: ShardWriter = None,
+    pool: Pool = None
 ):
+    """
+    `writer` and `pool` (from `hash_func.pool`) can be shared across files;
+    by default the file gets its own ones.
+    """
     assert chunksize > 0 and n_processes > 0
-    n_lines = int(os.popen(f"wc -l {os.path.abspath(inpath)}").read().strip().split()[0])
+    total_bytes = os.path.getsize(inpath)
     batchsize = n_processes * chunksize
-    batch_lines = []
-    with open(inpath, encoding="utf-8") as f:
-        for line in tqdm(f, desc="Encoding", total=n_lines, leave=False):
-            line = line.strip()
-            if not line:
-                continue
-            batch_lines.append(line)
-            if len(batch_lines) >= batchsize:
-                encoded_lines = hash_func.encode_batch(batch_lines, n_processes, chunksize)
-                save_shards(shard_root, encoded_lines, prefix_length)
-                batch_lines = []
-        if batch_lines:
-            encoded_lines = hash_func.encode_batch(batch_lines, n_processes, chunksize)
-            save_shards(shard_root, encoded_lines, prefix_length)
+    with ExitStack() as stack:
+        if writer is None:
+            writer = stack.enter_context(ShardWriter(shard_root, prefix_length))
+        if pool is None:
+            pool = stack.enter_context(hash_func.pool(n_processes))
+        io_pool = stack.enter_context(ThreadPoolExecutor(max_workers=1))
+        progress = stack.enter_context(
+            tqdm(desc="Encoding", total=total_bytes, unit="B", unit_scale=True, leave=False)
+        )
+        # the previous batch is written to shards while the current one is encoded
+        writing = None
+        for batch_lines in read_batches(inpath, batchsize, progress):
+            encoded_lines = hash_func.encode_batch(batch_lines, n_processes, chunksize, pool)
+            if writing is not None:
+                writing.result()
+            writing = io_pool.submit(writer.write_many, encoded_lines)
+        if writing is not None:
+            writing.result()
 
 
 def task_encode(
@@ -92,15 +362,63 @@ def task_encode(
     else:
         inputs = [path for input in inputs for path in glob(input)]
     hash_func = Encoder(hash_func_type, Normalizer(hash_func_input_format))
-    for inpath in tqdm(inputs, desc="Encode files", total=len(inputs)):
-        encode_a_file(
-            inpath=inpath,
-            shard_root=shard_root,
-            chunksize=chunksize,
-            n_processes=n_processes,
-            hash_func=hash_func,
-            prefix_length=prefix_length,
-        )
+    with ShardWriter(shard_root, prefix_length, precompute=True) as writer, hash_func.pool(n_processes) as pool:
+        for inpath in tqdm(inputs, desc="Encode files", total=len(inputs)):
+            encode_a_file(
+                inpath=inpath,
+                shard_root=shard_root,
+                chunksize=chunksize,
+                n_processes=n_processes,
+                hash_func=hash_func,
+                prefix_length=prefix_length,
+                writer=writer,
+                pool=pool,
+            )
+
+
+def dedup_shard(shard: str, sort: bool = False) -> Tuple[bytes, int, int]:
+    """
+    Returns the deduplicated texts of a shard as newline-terminated UTF-8 bytes,
+    with the number of lines before and after deduplication.
+    With `sort=True` the shard file is rewritten in order of hash code.
+    """
+    # loading shard
+    records = read_records(shard)
+    if not records:
+        return b"", 0, 0
+    codes, all_texts = zip(*records)
+
+    # deduplicating texts; keeps the first text of each code, in order of appearance.
+    # building the dict from the reversed columns lets the first occurrence win in C
+    first_index = dict(zip(reversed(codes), range(len(codes) - 1, -1, -1)))
+    texts = [all_texts[i] for i in sorted(first_index.values())]
+
+    # sort lines in shard
+    if sort:
+        with open(shard, "wb") as f:
+            f.writelines(pack_record(code, text) for code, text in sorted(records, key=itemgetter(0)))
+
+    return b"".join(text + b"\n" for text in texts), len(records), len(texts)
+
+
+def iter_dedup_shards(shards: List[str], sort: bool = False, n_processes: int = 1):
+    """
+    Yield `dedup_shard` results in the order of `shards`.
+    With `n_processes > 1` at most `2 * n_processes` shards are in flight, so results
+    cannot pile up in memory when the consumer is slower than the workers.
+    """
+    if n_processes <= 1:
+        for shard in shards:
+            yield dedup_shard(shard, sort)
+        return
+    with ProcessPoolExecutor(max_workers=n_processes) as pool:
+        pending = deque()
+        for shard in shards:
+            if len(pending) >= 2 * n_processes:
+                yield pending.popleft().result()
+            pending.append(pool.submit(dedup_shard, shard, sort))
+        while pending:
+            yield pending.popleft().result()
 
 
 def task_merge(
@@ -108,53 +426,51 @@ def task_merge(
     shard_root: str,
     prefix_length: int = 4,
     max_block_size: int = None,
-    sort: bool = False
+    sort: bool = False,
+    n_processes: int = 1
 ):
     depth = math.ceil(prefix_length / 2)
-    wildcard = os.path.sep.join(["*"] * depth)
-    shards = glob(f"{shard_root}/{wildcard}.shard")
+    shards = list(iter_shards(shard_root, depth))
     os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
 
     n_duplicated, n_deduplicated = 0, 0
 
+    # without `max_block_size` the block never rolls over; an infinite limit keeps
+    # the per-shard check to a single comparison instead of a None test plus a comparison
     block_size, block_index = 0, 0
     if max_block_size is None:
         output_path = output
+        block_limit = math.inf
     else:
         output_path = f"{output}.{block_index}"
+        block_limit = max_block_size
 
-    for shard in tqdm(shards, desc="Merge", total=len(shards)):
-        # loading shard
-        with open(shard, encoding="utf-8") as f:
-            lines = [line.strip().split(" ", 1) for line in f]
-        n_duplicated += len(lines)
-
-        # deduplicating texts
-        unique = defaultdict(lambda: [])
-        for code, text in lines:
-            unique[code].append(text)
-        texts = [texts[0] for texts in unique.values()]
-        n_deduplicated += len(texts)
-
-        # blocking
-        texts_size = sum(len(text.encode("utf-8")) for text in texts) + len(texts)
-        if (max_block_size is not None) and ((block_size + texts_size) > max_block_size):
-            block_size, block_index = texts_size, (block_index + 1)
-            output_path = f"{output}.{block_index}"
-        else:
-            block_size += texts_size
-
-        # write deduplicated texts
-        with open(output_path, "a", encoding="utf-8") as f:
-            for text in texts:
-                f.write(f"{text}\n")
+    # shards are deduplicated in parallel; blocking and writing stay in this process
+    # so that the output order follows `shards`.
+    # the output block stays open with a large buffer and is reopened only on rollover
+    f = open(output_path, "ab", buffering=1 << 22)
+    try:
+        results = iter_dedup_shards(shards, sort, n_processes)
+        for texts, n_lines, n_texts in tqdm(results, desc="Merge", total=len(shards)):
+            n_duplicated += n_lines
+            n_deduplicated += n_texts
+            if not texts:
+                continue
 
-        # sort lines in shard
-        if sort:
-            with open(shard, "w", encoding="utf-8") as f:
-                for code, texts in sorted(unique.items()):
-                    for text in texts:
-                        f.write(f"{code} {text}\n")
+            # blocking
+            texts_size = len(texts)
+            if (block_size + texts_size) > block_limit:
+                block_size, block_index = texts_size, (block_index + 1)
+                output_path = f"{output}.{block_index}"
+                f.close()
+                f = open(output_path, "ab", buffering=1 << 22)
+            else:
+                block_size += texts_size
+
+            # write deduplicated texts
+            f.write(texts)
+    finally:
+        f.close()
 
     percentage = 100 * n_deduplicated / n_duplicated
     print(f"acquired {percentage:.6}% deduplicated texts")
@@ -205,28 +521,89 @@ def task_dedup(
         shard_root=shard_root,
         prefix_length=prefix_length,
         max_block_size=max_block_size,
-        sort=sort
+        sort=sort,
+        n_processes=n_processes
     )
 
     if not keep:
-        os.system(f"rm -r {os.path.abspath(shard_root)}")
+        remove_shards(shard_root)
 
 
 def save_shards(
     shard_root: str,
-    encoded_lines: List[str],
+    encoded_lines: List[Tuple[Union[str, bytes], bytes]],
     prefix_length: int = 4
 ):
-    assert prefix_length >= 2
-    shards = defaultdict(lambda: [])
-    for line, code in encoded_lines:
-        shards[(code[:prefix_length], code)].append(line)
-    for (prefix, code), lines in shards.items():
-        shard_path = get_shard_path(shard_root, prefix)
-        os.makedirs(os.path.dirname(os.path.abspath(shard_path)), exist_ok=True)
-        with open(shard_path, "a", encoding="utf-8") as f:
-            for line in lines:
-                f.write(f"{code} {line}\n")
+    with ShardWriter(shard_root, prefix_length) as writer:
+        writer.write_many(encoded_lines)
+
+
+def remove_shards(shard_root: str, n_threads: int = 16):
+    """
+    Remove `shard_root`, deleting its top-level entries in parallel threads
+    (`unlink` releases the GIL).
+    """
+    with os.scandir(shard_root) as entries:
+        removes = [
+            partial(shutil.rmtree, entry.path) if entry.is_dir(follow_symlinks=False)
+            else partial(os.remove, entry.path)
+            for entry in entries
+        ]
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        for future in [pool.submit(remove) for remove in removes]:
+            future.result()
+    os.rmdir(shard_root)
+
+
+def pack_record(code: bytes, text: bytes) -> bytes:
+    """
+    Example:
+        >>> pack_record(b"\\x97\\x9e", b"Say hello")
+        $ b'\\x02\\t\\x00\\x00\\x00\\x97\\x9eSay hello'
+    """
+    return _RECORD_HEADER.pack(len(code), len(text)) + code + text
+
+
+def read_records(path: str) -> List[Tuple[bytes, bytes]]:
+    """
+    Returns (code, text) pairs of a shard file written with `pack_record`.
+    """
+    if os.path.getsize(path) == 0:
+        return []
+    records = []
+    unpack_from, header_size = _RECORD_HEADER.unpack_from, _RECORD_HEADER.size
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset, size = 0, len(mm)
+        while offset < size:
+            code_size, text_size = unpack_from(mm, offset)
+            code_begin = offset + header_size
+            text_begin = code_begin + code_size
+            offset = text_begin + text_size
+            records.append((mm[code_begin:text_begin], mm[text_begin:offset]))
+    return records
+
+
+def iter_shards(shard_root: str, depth: int):
+    """
+    Yield the `.shard` files `depth` path components below `shard_root`,
+    listing every directory once with `os.scandir`.
+
+    Example:
+        >>> list(iter_shards("path/to", 2))
+        $ ['path/to/12/34.shard', 'path/to/12/35.shard', ...]
+    """
+    if not os.path.isdir(shard_root):
+        return
+    stack = [(shard_root, 1)]
+    while stack:
+        path, level = stack.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if level < depth:
+                    if entry.is_dir():
+                        stack.append((entry.path, level + 1))
+                elif entry.name.endswith(".shard"):
+                    yield entry.path
 
 
 def get_shard_path(shard_root: str, code: str):
@@ -241,6 +618,62 @@ def get_shard_path(shard_root: str, code: str):
     return path
 
 
+def read_lines(inpath: str, block_size: int = 1 << 26):
+    """
+    Yield `(n_bytes, lines)` for every `block_size` bytes of `inpath`, cut after a newline.
+    `lines` are the stripped, non-empty lines of the block as UTF-8 bytes.
+    The file is memory-mapped and scanned in place, without a per-line buffer.
+
+    Example:
+        >>> list(read_lines("path/to/text"))  # "Say hello\\n\\n  hello \\r\\n"
+        $ [(21, [b'Say hello', b'hello'])]
+    """
+    if os.path.getsize(inpath) == 0:
+        return
+    with open(inpath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        begin, size = 0, len(mm)
+        while begin < size:
+            end = (mm.find(b"\n", begin + block_size) + 1) or size
+            yield end - begin, _LINE_PATTERN.findall(mm, begin, end)
+            begin = end
+
+
+def read_batches(inpath: str, batchsize: int, progress: tqdm = None):
+    """
+    Yield lists of `batchsize` stripped, non-empty lines (the last one may be shorter).
+    """
+    batch_lines = []
+    for n_bytes, lines in read_lines(inpath):
+        if progress is not None:
+            progress.update(n_bytes)
+        batch_lines += lines
+        # slice full batches by index and keep only the left-over tail,
+        # instead of re-copying the rest of the block after every batch
+        n_full = len(batch_lines) - len(batch_lines) % batchsize
+        for begin in range(0, n_full, batchsize):
+            yield batch_lines[begin: begin + batchsize]
+        batch_lines = batch_lines[n_full:]
+    if batch_lines:
+        yield batch_lines
+
+
+def split_by_lengths(data: bytes, lengths: Iterable[int]) -> List[bytes]:
+    """
+    Split lines joined by single separators using their lengths.
+
+    Example:
+        >>> split_by_lengths(b"first\\nline\\nsecond", [10, 6])
+        $ [b'first\\nline', b'second']
+    """
+    lines, begin = [], 0
+    for length in lengths:
+        lines.append(data[begin: begin + length])
+        begin += length + 1
+    return lines
+
+
 def humanized_to_number(max_block_size):
     """
     Examples: